@@ -1,8 +1,13 @@
 import os
 import time
 import re 
+import json
+import math
+import queue
+import threading
 import base64 
 import requests 
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from dotenv import load_dotenv
 from PIL import Image
 from google.api_core.exceptions import GoogleAPICallError 
@@ -10,31 +15,26 @@ from io import BytesIO
 
 load_dotenv()
 
-def get_vlm_reasoning_score(image_path: str) -> float:
-    """
-    Use Gemini VLM for AI detection, using a stable HTTP approach 
-    to bypass SDK environment conflicts and ensure reliable scoring.
-    """
-    
-    MODEL_NAME = "gemini-2.5-flash"
-    API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{MODEL_NAME}:generateContent"
-    API_KEY = os.getenv("GEMINI_API_KEY", "") 
-    
-    SAFER_FALLBACK = 0.5 
-    
-    
-    try:
-        img = Image.open(image_path)
-        buffer = BytesIO()
-        # Save as JPEG for efficient transfer, even if original was PNG
-        img.convert('RGB').save(buffer, format="JPEG", quality=85)
-        encoded_image_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        mime_type = "image/jpeg"
-    except Exception as e:
-        print(f"❌ Error during image preparation/encoding: {e}")
-        return SAFER_FALLBACK
+MODEL_NAME = "gemini-2.5-flash"
+# Overridable so the VLM stage can be pointed at a local stub of the Gemini endpoint.
+API_BASE_URL = os.getenv("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+
+SAFER_FALLBACK = 0.5 
 
-    prompt = """
+# Micro-batching: pending images are gathered for up to this window and sent
+# in a single multi-image request. A window of 0 disables batching.
+VLM_BATCH_WINDOW_MS = float(os.getenv("VLM_BATCH_WINDOW_MS", "0"))
+VLM_BATCH_MAX_SIZE = int(os.getenv("VLM_BATCH_MAX_SIZE", "8"))
+# Cap on total base64 bytes per batch, kept under Gemini's 20 MB inline request limit.
+VLM_BATCH_MAX_BYTES = int(os.getenv("VLM_BATCH_MAX_BYTES", "14000000"))
+# Batches dispatched concurrently while the collector keeps gathering the next one.
+VLM_MAX_INFLIGHT_BATCHES = int(os.getenv("VLM_MAX_INFLIGHT_BATCHES", "4"))
+# Safety net for callers waiting on a batch; normal batches resolve well within it.
+VLM_RESULT_TIMEOUT_S = float(os.getenv("VLM_RESULT_TIMEOUT_S", "300"))
+# Longer side sampled animation/multi-page frames are downscaled to before encoding.
+VLM_FRAME_MAX_SIDE = int(os.getenv("VLM_FRAME_MAX_SIDE", "1536"))
+
+PROMPT = """
 You are an expert forensic analyst detecting AI-generated images.
 Analyze this image for signs of AI generation or manipulation. Look for:
 
@@ -51,15 +51,55 @@ Analyze this image for signs of AI generation or manipulation. Look for:
 Rate from 0.0 (Definitely real photo) to 1.0 (Definitely AI-generated/edited).
 Respond with ONLY a number between 0.0 and 1.0. No explanation.
 """
-    
-    payload = {
-        "contents": [
-            {"role": "user", "parts": [
-                {"text": prompt},
-                {"inlineData": {"mimeType": mime_type, "data": encoded_image_data}}
-            ]}
-        ]
-    }
+
+BATCH_PROMPT = """
+You are an expert forensic analyst detecting AI-generated images.
+You will receive {count} independent images, labelled "Image 1" to "Image {count}".
+Analyze EACH image separately for signs of AI generation or manipulation. Look for:
+
+🎨 AI Generation Indicators (increase score):
+- Overly smooth/plastic textures (especially skin, fabric, wood)
+- Perfect symmetry or unnatural patterns
+- Impossible lighting/reflections (multiple light sources, wrong shadows)
+
+📸 Real Photo Indicators (decrease score):
+- Natural sensor noise and grain
+- Realistic compression artifacts
+- Consistent lighting physics
+
+Rate each image from 0.0 (Definitely real photo) to 1.0 (Definitely AI-generated/edited).
+Respond with ONLY a JSON array of exactly {count} numbers between 0.0 and 1.0,
+in image order, e.g. [0.1, 0.9]. No explanation.
+"""
+
+
+def encode_vlm_image(image_path: str, max_side: int = None):
+    """
+    Re-encode an image as base64 JPEG for inline transfer, optionally
+    downscaled so its longer side is at most max_side. Returns None on failure.
+    """
+    try:
+        img = Image.open(image_path)
+        if max_side:
+            img.thumbnail((max_side, max_side))
+        buffer = BytesIO()
+        # Save as JPEG for efficient transfer, even if original was PNG
+        img.convert('RGB').save(buffer, format="JPEG", quality=85)
+        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+    except Exception as e:
+        print(f"❌ Error during image preparation/encoding: {e}")
+        return None
+
+
+def _generate_content(parts: list, timeout: float = 20) -> str:
+    """
+    POST a generateContent request with exponential backoff and return the raw
+    text of the first candidate. Raises on final transport failure; client
+    errors other than 429 are deterministic and raised without retrying.
+    """
+    api_url = f"{API_BASE_URL}/models/{MODEL_NAME}:generateContent"
+    api_key = os.getenv("GEMINI_API_KEY", "") 
+    payload = {"contents": [{"role": "user", "parts": parts}]}
     
     # --- API Call with Requests and Exponential Backoff ---
     max_retries = 3
@@ -70,40 +110,303 @@ Respond with ONLY a number between 0.0 and 1.0. No explanation.
             print(f"🤖 Calling Gemini VLM (HTTP Attempt {attempt + 1})...")
             
             response = requests.post(
-                f"{API_URL}?key={API_KEY}",
+                f"{api_url}?key={api_key}",
                 json=payload,
                 headers={'Content-Type': 'application/json'},
-                timeout=20 # Added timeout for stability
+                timeout=timeout # Added timeout for stability
             )
             response.raise_for_status() 
             
             result = response.json()
-            
-            # --- Result Parsing ---
-            raw_response = result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '').strip()
-            
-            try:
-                score = float(raw_response)
-                score = min(max(score, 0.0), 1.0)
-                print(f"✅ VLM Parsed Score: {score:.3f}")
-                return score
-            except ValueError:
-                numbers = re.findall(r'0\.\d+|1\.0|0\.0', raw_response)
-                if numbers:
-                    score = float(numbers[0])
-                    print(f"✅ VLM Extracted Score: {score:.3f}")
-                    return score
-                return SAFER_FALLBACK
+            return result.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text', '').strip()
 
         except requests.exceptions.RequestException as e:
+            if _is_client_error(e):
+                print(f"❌ API rejected request: {e}")
+                raise
             if attempt < max_retries - 1:
                 time.sleep(base_delay * (2 ** attempt))
             else:
                 print(f"❌ Final API Error after {max_retries} attempts: {e}")
-                return SAFER_FALLBACK
+                raise
+
+
+def _is_client_error(error: Exception) -> bool:
+    """True for 4xx responses that retrying won't fix (everything but 429)."""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def _parse_score(raw_response: str) -> float:
+    """Parse a single-image reply into a score in [0, 1]."""
+    try:
+        score = float(raw_response)
+        score = min(max(score, 0.0), 1.0)
+        print(f"✅ VLM Parsed Score: {score:.3f}")
+        return score
+    except ValueError:
+        numbers = re.findall(r'0\.\d+|1\.0|0\.0', raw_response)
+        if numbers:
+            score = float(numbers[0])
+            print(f"✅ VLM Extracted Score: {score:.3f}")
+            return score
+        return SAFER_FALLBACK
+
+
+def _parse_batch_scores(raw_response: str, count: int):
+    """
+    Parse a multi-image reply into one score per image.
+    Returns None if the reply is malformed or the count does not match.
+    """
+    match = re.search(r'\[.*?\]', raw_response, re.DOTALL)
+    if not match:
+        return None
+    try:
+        values = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(values, list) or len(values) != count:
+        return None
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return None
+    # json.loads accepts NaN/Infinity, which would survive the clamp below
+    if not all(math.isfinite(v) for v in values):
+        return None
+    return [min(max(float(v), 0.0), 1.0) for v in values]
+
+
+def _score_encoded_image(encoded_image_data: str) -> float:
+    try:
+        raw_response = _generate_content([
+            {"text": PROMPT},
+            {"inlineData": {"mimeType": "image/jpeg", "data": encoded_image_data}}
+        ])
+        return _parse_score(raw_response)
+    except Exception as e:
+        print(f"❌ General VLM Error: {e}")
+        return SAFER_FALLBACK
+
+
+def _score_encoded_images_individually(encoded_images: list) -> list:
+    with ThreadPoolExecutor(max_workers=len(encoded_images)) as pool:
+        return list(pool.map(_score_encoded_image, encoded_images))
+
+
+def _score_encoded_batch(encoded_images: list) -> list:
+    """
+    Score several images with one multi-image request. Falls back to
+    concurrent per-image calls if the reply cannot be split or the request is
+    rejected as a client error (e.g. too large); any other failed request
+    returns SAFER_FALLBACK for every image rather than retrying per image.
+    """
+    if len(encoded_images) == 1:
+        return [_score_encoded_image(encoded_images[0])]
+    
+    parts = [{"text": BATCH_PROMPT.format(count=len(encoded_images))}]
+    for i, data in enumerate(encoded_images, start=1):
+        parts.append({"text": f"Image {i}:"})
+        parts.append({"inlineData": {"mimeType": "image/jpeg", "data": data}})
+    
+    try:
+        raw_response = _generate_content(parts, timeout=20 + 5 * len(encoded_images))
+    except requests.exceptions.RequestException as e:
+        if not _is_client_error(e):
+            print(f"❌ Batch VLM Error: {e}")
+            return [SAFER_FALLBACK] * len(encoded_images)
+        print(f"⚠️ Batch request rejected, falling back to {len(encoded_images)} per-image calls")
+        return _score_encoded_images_individually(encoded_images)
+    except Exception as e:
+        print(f"❌ Batch VLM Error: {e}")
+        return [SAFER_FALLBACK] * len(encoded_images)
+    
+    scores = _parse_batch_scores(raw_response, len(encoded_images))
+    if scores is None:
+        print(f"⚠️ Malformed batch reply, falling back to {len(encoded_images)} per-image calls")
+        return _score_encoded_images_individually(encoded_images)
+    
+    print(f"✅ VLM Batch Scores: {', '.join(f'{s:.3f}' for s in scores)}")
+    return scores
+
+
+def get_vlm_reasoning_scores(encoded_images: list) -> list:
+    """
+    Score several images, prepared with encode_vlm_image, using as few
+    multi-image Gemini requests as VLM_BATCH_MAX_SIZE and VLM_BATCH_MAX_BYTES
+    allow, with at most VLM_MAX_INFLIGHT_BATCHES running at once. Entries
+    that failed to encode get SAFER_FALLBACK.
+    """
+    encoded = list(encoded_images)
+    valid = [data for data in encoded if data is not None]
+    chunks = _chunk_encoded_images(valid, VLM_BATCH_MAX_SIZE, VLM_BATCH_MAX_BYTES)
+    
+    batch_scores = []
+    if chunks:
+        with ThreadPoolExecutor(max_workers=min(len(chunks), max(VLM_MAX_INFLIGHT_BATCHES, 1))) as pool:
+            for chunk, scores in zip(chunks, pool.map(_score_encoded_batch, chunks)):
+                # Pad defensively so every image keeps its own slot
+                batch_scores.extend(list(scores)[:len(chunk)] + [SAFER_FALLBACK] * (len(chunk) - len(scores)))
+    
+    batch_scores = iter(batch_scores)
+    return [next(batch_scores) if data is not None else SAFER_FALLBACK for data in encoded]
+
+
+def _chunk_encoded_images(encoded_images: list, max_size: int, max_bytes: int) -> list:
+    """Split images, in order, into batches capped by count and total encoded bytes."""
+    chunks, chunk, chunk_bytes = [], [], 0
+    for data in encoded_images:
+        if chunk and (len(chunk) >= max(max_size, 1) or chunk_bytes + len(data) > max_bytes):
+            chunks.append(chunk)
+            chunk, chunk_bytes = [], 0
+        chunk.append(data)
+        chunk_bytes += len(data)
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class VLMBatchDispatcher:
+    """
+    Micro-batching dispatcher for the VLM stage. Callers block in submit()
+    while a background collector gathers pending images for up to window_ms
+    (capped by count and total encoded bytes) and hands each batch to a
+    bounded pool, so up to max_inflight_batches requests run at once and
+    each caller gets its own score.
+    """
+    
+    def __init__(self, window_ms: float = VLM_BATCH_WINDOW_MS, max_batch_size: int = VLM_BATCH_MAX_SIZE,
+                 max_inflight_batches: int = VLM_MAX_INFLIGHT_BATCHES, result_timeout_s: float = VLM_RESULT_TIMEOUT_S,
+                 max_batch_bytes: int = VLM_BATCH_MAX_BYTES):
+        self.window_s = max(window_ms, 0.0) / 1000.0
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_batch_bytes = max_batch_bytes
+        self.result_timeout_s = result_timeout_s
+        max_inflight_batches = max(max_inflight_batches, 1)
+        self._queue = queue.Queue()
+        # Entry that didn't fit the previous batch's byte budget; starts the next one
+        self._carry = None
+        self._inflight = threading.BoundedSemaphore(max_inflight_batches)
+        self._executor = ThreadPoolExecutor(max_workers=max_inflight_batches, thread_name_prefix="vlm-batch")
+        self._worker = None
+        self._lock = threading.Lock()
+    
+    def submit(self, image_path: str) -> float:
+        # Encode in the caller's thread so preparation runs in parallel
+        encoded_image_data = encode_vlm_image(image_path)
+        if encoded_image_data is None:
+            return SAFER_FALLBACK
         
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((encoded_image_data, future))
+        try:
+            return future.result(timeout=self.result_timeout_s)
+        except FutureTimeoutError:
+            future.cancel()
+            print(f"❌ VLM batch did not resolve within {self.result_timeout_s:.0f}s")
+            return SAFER_FALLBACK
+    
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="vlm-batcher", daemon=True)
+                self._worker.start()
+    
+    def _run(self):
+        while True:
+            # Wait for a free slot first, so images keep queueing up for the
+            # next batch while every slot is busy.
+            self._inflight.acquire()
+            batch = [self._take()]
+            batch_bytes = len(batch[0][0])
+            deadline = time.monotonic() + self.window_s
+            while len(batch) < self.max_batch_size:
+                try:
+                    entry = self._take(deadline)
+                except queue.Empty:
+                    break
+                if batch_bytes + len(entry[0]) > self.max_batch_bytes:
+                    self._carry = entry
+                    break
+                batch.append(entry)
+                batch_bytes += len(entry[0])
+            try:
+                self._executor.submit(self._dispatch, batch)
+            except BaseException:
+                self._resolve(batch, [])
+                self._inflight.release()
+                raise
+    
+    def _take(self, deadline: float = None):
+        """Next queued entry whose caller is still waiting; raises queue.Empty past the deadline."""
+        while True:
+            if self._carry is not None:
+                entry, self._carry = self._carry, None
+            elif deadline is None:
+                entry = self._queue.get()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Empty
+                entry = self._queue.get(timeout=remaining)
+            # Callers that timed out cancel their future; don't pay to score them
+            if not entry[1].cancelled():
+                return entry
+    
+    def _dispatch(self, batch: list):
+        scores = []
+        try:
+            batch = [entry for entry in batch if not entry[1].cancelled()]
+            if batch:
+                scores = _score_encoded_batch([data for data, _ in batch])
         except Exception as e:
             print(f"❌ General VLM Error: {e}")
-            return SAFER_FALLBACK
-            
-    return SAFER_FALLBACK
\ No newline at end of file
+        finally:
+            self._resolve(batch, scores)
+            self._inflight.release()
+    
+    @staticmethod
+    def _resolve(batch: list, scores: list):
+        """Resolve every caller's future, padding missing scores with SAFER_FALLBACK."""
+        for i, (_, future) in enumerate(batch):
+            score = scores[i] if i < len(scores) else SAFER_FALLBACK
+            try:
+                future.set_result(score)
+            except InvalidStateError:
+                # Caller already gave up (cancelled after timeout)
+                pass
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_vlm_dispatcher() -> VLMBatchDispatcher:
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = VLMBatchDispatcher()
+        return _dispatcher
+
+
+def get_batched_vlm_reasoning_score(image_path: str) -> float:
+    """
+    Score one image through the shared micro-batching dispatcher, or with a
+    direct call when batching is disabled (VLM_BATCH_WINDOW_MS=0).
+    """
+    if VLM_BATCH_WINDOW_MS <= 0:
+        return get_vlm_reasoning_score(image_path)
+    return get_vlm_dispatcher().submit(image_path)
+
+
+def get_vlm_reasoning_score(image_path: str) -> float:
+    """
+    Use Gemini VLM for AI detection, using a stable HTTP approach 
+    to bypass SDK environment conflicts and ensure reliable scoring.
+    """
+    
+    encoded_image_data = encode_vlm_image(image_path)
+    if encoded_image_data is None:
+        return SAFER_FALLBACK
+    
+    return _score_encoded_image(encoded_image_data)
@@ -0,0 +1,55 @@
+from PIL import Image
+import os
+import tempfile
+
+# Analyze every FRAME_SAMPLE_STRIDE-th frame, capped at FRAME_SAMPLE_BUDGET
+# frames spread evenly across the sequence.
+FRAME_SAMPLE_STRIDE = max(int(os.getenv("FRAME_SAMPLE_STRIDE", "1")), 1)
+FRAME_SAMPLE_BUDGET = max(int(os.getenv("FRAME_SAMPLE_BUDGET", "8")), 1)
+
+
+def get_frame_count(image_path: str) -> int:
+    """Number of frames/pages in the file (1 for still images or unreadable files)."""
+    try:
+        with Image.open(image_path) as img:
+            return int(getattr(img, 'n_frames', 1))
+    except Exception:
+        return 1
+
+
+def select_frame_indices(n_frames: int, stride: int = FRAME_SAMPLE_STRIDE, budget: int = FRAME_SAMPLE_BUDGET) -> list[int]:
+    """Pick ascending frame indices by stride, then thin evenly to the budget."""
+    candidates = list(range(0, n_frames, max(stride, 1)))
+    if len(candidates) <= budget:
+        return candidates
+    step = len(candidates) / budget
+    return [candidates[int(i * step)] for i in range(budget)]
+
+
+def iter_sampled_frames(image_path: str, stride: int = FRAME_SAMPLE_STRIDE, budget: int = FRAME_SAMPLE_BUDGET):
+    """
+    Lazily decode the sampled frames one at a time, yielding each as a temporary
+    PNG path. The caller owns (and must delete) every yielded file.
+    """
+    with Image.open(image_path) as img:
+        n_frames = int(getattr(img, 'n_frames', 1))
+        for index in select_frame_indices(n_frames, stride, budget):
+            frame_path = None
+            try:
+                img.seek(index)
+                frame = img.convert('RGB')
+                fd, frame_path = tempfile.mkstemp(suffix='.png')
+                os.close(fd)
+                try:
+                    # Lossless so the analyzers see the decoded frame, not a re-encode
+                    frame.save(frame_path, 'PNG')
+                finally:
+                    frame.close()
+            except Exception as e:
+                # One undecodable frame/page only costs that frame
+                print(f"⚠️ Skipping frame {index}: {e}")
+                if frame_path is not None and os.path.exists(frame_path):
+                    os.remove(frame_path)
+                continue
+
+            yield frame_path
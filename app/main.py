@@ -193,8 +193,10 @@ async def root():
     return HTML_TEMPLATE
 
 
+# Plain def so FastAPI runs each request in its threadpool; concurrent uploads
+# can then share a VLM micro-batch instead of blocking the event loop.
 @app.post("/api/v1/ai-check", response_model=AIServiceResponse)
-async def check_ai_image(image: UploadFile = File(...)):
+def check_ai_image(image: UploadFile = File(...)):
     if not image.content_type.startswith('image/'):
         raise HTTPException(400, "File must be an image")
     with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as tmp:
@@ -6,4 +6,5 @@ class AIServiceResponse(BaseModel):
     reasoning: str
     P_synthetic: float = Field(..., ge=0.0, le=1.0)
     forensics_breakdown: Dict[str, float]
-    confidence: float = Field(..., ge=0.0, le=1.0)
\ No newline at end of file
+    confidence: float = Field(..., ge=0.0, le=1.0)
+    frames_analyzed: int = Field(1, ge=1, description="Sampled frames for animated/multi-page input")
\ No newline at end of file
@@ -1,18 +1,33 @@
 import os
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from dotenv import load_dotenv
 from .forensics.ela_analyzer import get_ela_score
 from .forensics.frequency_analyzer import get_frequency_score
 from .forensics.prnu_analyzer import get_prnu_score
-from .ai.gemini_vlm import get_vlm_reasoning_score
+from .forensics.frame_sampler import get_frame_count, iter_sampled_frames
+from .ai.gemini_vlm import get_batched_vlm_reasoning_score, encode_vlm_image, get_vlm_reasoning_scores, VLM_FRAME_MAX_SIDE
 
 load_dotenv()
 
 FIXED_AI_THRESHOLD = 0.5
+# Sampled frames analyzed concurrently; also bounds how many decoded frames are on disk at once.
+FRAME_ANALYSIS_WORKERS = max(int(os.getenv("FRAME_ANALYSIS_WORKERS", "4")), 1)
 
 def analyze_image_forensics(image_path: str) -> dict:
     """Multi-signal forensic analysis."""
     
+    scores = get_signal_scores(image_path)
+    
+    # 4. VLM (Visual Reasoning)
+    scores['vlm'] = get_batched_vlm_reasoning_score(image_path)
+    
+    return fuse_forensic_scores(scores)
+
+
+def get_signal_scores(image_path: str) -> dict:
+    """Pixel-level forensic signals (everything except the VLM)."""
+    
     scores = {}
     
     # 1. ELA (Robust VoV)
@@ -33,8 +48,11 @@ def analyze_image_forensics(image_path: str) -> dict:
     except Exception as e:
         scores['prnu'] = 0.0
     
-    # 4. VLM (Visual Reasoning)
-    scores['vlm'] = get_vlm_reasoning_score(image_path)
+    return scores
+
+
+def fuse_forensic_scores(scores: dict) -> dict:
+    """Weighted fusion of the signal and VLM scores into P(fraud)."""
     
     # Extract final scores
     ela_score = float(scores.get('ela', 0.0))
@@ -85,13 +103,96 @@ def calculate_confidence(scores: dict, vlm_score: float) -> float:
         return round(0.30 + (agreement * 0.20), 2)
 
 
+def _analyze_frame_file(frame_index: int, frame_path: str) -> tuple[int, dict, str | None]:
+    try:
+        return frame_index, get_signal_scores(frame_path), encode_vlm_image(frame_path, max_side=VLM_FRAME_MAX_SIDE)
+    finally:
+        try:
+            os.remove(frame_path)
+        except OSError:
+            pass
+
+
+def _collect_frame_results(futures, results: list):
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            print(f"❌ Frame analysis failed: {e}")
+
+
+def analyze_frames_forensics(image_path: str) -> list[dict]:
+    """
+    Run the forensic analysis on sampled frames of an animated or multi-page
+    image. Frames are decoded lazily and only once a worker is free, so at
+    most FRAME_ANALYSIS_WORKERS are on disk regardless of frame count. The
+    VLM scores the sampled frames, in order, with as few multi-image
+    requests as the batch limits allow.
+    """
+    
+    if get_frame_count(image_path) <= 1:
+        return [analyze_image_forensics(image_path)]
+    
+    frame_results = []
+    frame_paths = iter_sampled_frames(image_path)
+    frames = enumerate(frame_paths)
+    try:
+        with ThreadPoolExecutor(max_workers=FRAME_ANALYSIS_WORKERS) as pool:
+            pending = set()
+            while True:
+                if len(pending) >= FRAME_ANALYSIS_WORKERS:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _collect_frame_results(done, frame_results)
+                try:
+                    frame_index, frame_path = next(frames)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    # File can't be read as a sequence: keep the frames decoded so far
+                    print(f"⚠️ Frame decoding stopped early: {e}")
+                    break
+                pending.add(pool.submit(_analyze_frame_file, frame_index, frame_path))
+            _collect_frame_results(wait(pending).done, frame_results)
+    finally:
+        frame_paths.close()
+    
+    if not frame_results:
+        return [analyze_image_forensics(image_path)]
+    
+    # Completion order varies; keep the VLM request in frame order
+    frame_results.sort(key=lambda r: r[0])
+    vlm_scores = get_vlm_reasoning_scores([encoded for _, _, encoded in frame_results])
+    return [
+        fuse_forensic_scores({**signals, 'vlm': vlm_score})
+        for (_, signals, _), vlm_score in zip(frame_results, vlm_scores)
+    ]
+
+
+def aggregate_frame_forensics(frame_results: list[dict]) -> dict:
+    """
+    Combine per-frame results. A single synthetic frame is enough to flag the
+    upload, so the most suspicious frame drives P_fraud, the breakdown and
+    the confidence.
+    """
+    
+    worst = max(frame_results, key=lambda r: r['P_fraud'])
+    return {
+        'P_fraud': worst['P_fraud'],
+        'breakdown': worst['breakdown'],
+        'confidence': worst['confidence'],
+        'frames_analyzed': len(frame_results)
+    }
+
+
 def check_ai_status(image_path: str) -> dict:
     """
     Determines if an image is AI-generated (synthetic) or not.
+    Animated and multi-page images are judged on their sampled frames.
     """
     
-    forensics = analyze_image_forensics(image_path)
+    forensics = aggregate_frame_forensics(analyze_frames_forensics(image_path))
     P_synthetic = forensics['P_fraud']
+    frames_analyzed = forensics['frames_analyzed']
     
     
     threshold = 0.106
@@ -103,6 +204,9 @@ def check_ai_status(image_path: str) -> dict:
         decision = "REAL_PHOTO"
         reasoning = f"P(Synthetic)={P_synthetic:.3f} ≤ {threshold}. Image appears to be a real photograph."
     
+    if frames_analyzed > 1:
+        reasoning += f" Highest score across {frames_analyzed} sampled frames."
+    
     # Ensure all values are proper floats for Pydantic validation
     return {
         'decision': decision,
@@ -114,7 +218,8 @@ def check_ai_status(image_path: str) -> dict:
             'prnu': float(forensics['breakdown'].get('prnu', 0.0)),
             'vlm': float(forensics['breakdown'].get('vlm', 0.0))
         },
-        'confidence': float(forensics['confidence'])
+        'confidence': float(forensics['confidence']),
+        'frames_analyzed': int(frames_analyzed)
     }
 
 
@@ -0,0 +1,160 @@
+import os
+import tempfile
+import time
+
+import pytest
+from PIL import Image
+
+from app import services
+from app.forensics import frame_sampler
+
+N_FRAMES = 20
+
+
+@pytest.fixture
+def animated_gif(tmp_path):
+    # Frame i is a solid gray of level 10 * i so decoded frames can be identified
+    frames = [Image.new('RGB', (64, 64), (10 * i, 10 * i, 10 * i)) for i in range(N_FRAMES)]
+    path = tmp_path / "burst.gif"
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=50, loop=0)
+    return str(path)
+
+
+@pytest.fixture
+def frame_tmpdir(tmp_path, monkeypatch):
+    frame_dir = tmp_path / "frames"
+    frame_dir.mkdir()
+    monkeypatch.setattr(tempfile, 'tempdir', str(frame_dir))
+    return frame_dir
+
+
+@pytest.mark.parametrize('n_frames, stride, budget, expected', [
+    (20, 1, 8, [0, 2, 5, 7, 10, 12, 15, 17]),
+    (20, 5, 8, [0, 5, 10, 15]),
+    (20, 3, 3, [0, 6, 12]),
+    (3, 1, 8, [0, 1, 2]),
+    (1, 4, 8, [0]),
+])
+def test_select_frame_indices(n_frames, stride, budget, expected):
+    assert frame_sampler.select_frame_indices(n_frames, stride, budget) == expected
+
+
+def test_get_frame_count(animated_gif, tmp_path):
+    still = tmp_path / "still.png"
+    Image.new('RGB', (8, 8)).save(still)
+
+    assert frame_sampler.get_frame_count(animated_gif) == N_FRAMES
+    assert frame_sampler.get_frame_count(str(still)) == 1
+    assert frame_sampler.get_frame_count(str(tmp_path / "missing.gif")) == 1
+
+
+def test_iter_sampled_frames_decodes_selected_frames(animated_gif, frame_tmpdir):
+    levels = []
+    for frame_path in frame_sampler.iter_sampled_frames(animated_gif, stride=5, budget=8):
+        with Image.open(frame_path) as frame:
+            levels.append(frame.convert('L').getpixel((0, 0)))
+        os.remove(frame_path)
+
+    assert levels == [0, 50, 100, 150]
+    assert list(frame_tmpdir.iterdir()) == []
+
+
+def test_iter_sampled_frames_writes_lazily(animated_gif, frame_tmpdir):
+    frames = frame_sampler.iter_sampled_frames(animated_gif, stride=1, budget=8)
+    first = next(frames)
+
+    assert list(frame_tmpdir.iterdir()) == [frame_tmpdir / os.path.basename(first)]
+    frames.close()
+    os.remove(first)
+
+
+def test_analyze_frames_cleans_up_and_batches_vlm(animated_gif, frame_tmpdir, monkeypatch):
+    vlm_batches = []
+
+    def fake_signal_scores(frame_path):
+        assert len(list(frame_tmpdir.iterdir())) <= services.FRAME_ANALYSIS_WORKERS
+        with Image.open(frame_path) as frame:
+            level = frame.convert('L').getpixel((0, 0))
+        return {'ela': 0.0, 'frequency': level / 255, 'prnu': 0.0}
+
+    def fake_vlm_scores(encoded_images):
+        vlm_batches.append(len(encoded_images))
+        return [0.5] * len(encoded_images)
+
+    monkeypatch.setattr(services, 'get_signal_scores', fake_signal_scores)
+    monkeypatch.setattr(services, 'get_vlm_reasoning_scores', fake_vlm_scores)
+
+    results = services.analyze_frames_forensics(animated_gif)
+
+    assert len(results) == frame_sampler.FRAME_SAMPLE_BUDGET
+    assert vlm_batches == [frame_sampler.FRAME_SAMPLE_BUDGET]
+    assert list(frame_tmpdir.iterdir()) == []
+
+    aggregate = services.aggregate_frame_forensics(results)
+    worst = max(results, key=lambda r: r['P_fraud'])
+    assert aggregate['confidence'] == worst['confidence']
+    assert aggregate['frames_analyzed'] == len(results)
+
+
+def test_analyze_frames_keeps_going_after_a_frame_fails(animated_gif, frame_tmpdir, monkeypatch):
+    calls = []
+
+    def flaky_signal_scores(frame_path):
+        calls.append(frame_path)
+        if len(calls) == 2:
+            raise RuntimeError("analyzer crashed")
+        return {'ela': 0.0, 'frequency': 0.0, 'prnu': 0.0}
+
+    monkeypatch.setattr(services, 'get_signal_scores', flaky_signal_scores)
+    monkeypatch.setattr(services, 'get_vlm_reasoning_scores', lambda encoded: [0.5] * len(encoded))
+
+    results = services.analyze_frames_forensics(animated_gif)
+
+    assert len(results) == frame_sampler.FRAME_SAMPLE_BUDGET - 1
+    assert list(frame_tmpdir.iterdir()) == []
+
+
+def test_iter_sampled_frames_skips_undecodable_frame(animated_gif, frame_tmpdir, monkeypatch):
+    original_convert = Image.Image.convert
+    calls = []
+
+    def flaky_convert(self, *args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise OSError("unsupported mode")
+        return original_convert(self, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, 'convert', flaky_convert)
+
+    frame_paths = list(frame_sampler.iter_sampled_frames(animated_gif, stride=5, budget=8))
+    for path in frame_paths:
+        os.remove(path)
+
+    assert len(frame_paths) == 3
+    assert list(frame_tmpdir.iterdir()) == []
+
+
+def test_analyze_frames_sends_vlm_frames_in_frame_order(animated_gif, frame_tmpdir, monkeypatch):
+    vlm_inputs = []
+
+    def frame_level(frame_path):
+        with Image.open(frame_path) as frame:
+            return frame.convert('L').getpixel((0, 0))
+
+    def slow_early_frames(frame_path):
+        # Earlier frames finish last, so completion order is reversed
+        time.sleep((255 - frame_level(frame_path)) / 2000)
+        return {'ela': 0.0, 'frequency': 0.0, 'prnu': 0.0}
+
+    def fake_vlm_scores(encoded_images):
+        vlm_inputs.extend(encoded_images)
+        return [0.5] * len(encoded_images)
+
+    monkeypatch.setattr(services, 'get_signal_scores', slow_early_frames)
+    monkeypatch.setattr(services, 'encode_vlm_image', lambda path, max_side=None: frame_level(path))
+    monkeypatch.setattr(services, 'get_vlm_reasoning_scores', fake_vlm_scores)
+
+    services.analyze_frames_forensics(animated_gif)
+
+    assert vlm_inputs == sorted(vlm_inputs)
+    assert len(vlm_inputs) == frame_sampler.FRAME_SAMPLE_BUDGET
@@ -0,0 +1,210 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from app.ai import gemini_vlm
+
+
+class GeminiStub:
+    """Local stand-in for generateContent. Scores each inline image by its gray level."""
+
+    def __init__(self):
+        self.requests = []
+        self.batch_reply = None
+        self.batch_status = 200
+        self.lock = threading.Lock()
+
+    def reply(self, payload: dict) -> tuple[int, str]:
+        parts = payload['contents'][0]['parts']
+        images = [p['inlineData']['data'] for p in parts if 'inlineData' in p]
+        with self.lock:
+            self.requests.append(len(images))
+        scores = [self.score(data) for data in images]
+        if len(scores) == 1:
+            return 200, str(scores[0])
+        if self.batch_status != 200:
+            return self.batch_status, ''
+        if self.batch_reply is not None:
+            return 200, self.batch_reply
+        return 200, f"```json\n{json.dumps(scores)}\n```"
+
+    @staticmethod
+    def score(data: str) -> float:
+        img = Image.open(BytesIO(base64.b64decode(data))).convert('L')
+        return round(img.getpixel((0, 0)) / 255, 1)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    gemini = GeminiStub()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            status, text = gemini.reply(payload)
+            body = json.dumps({'candidates': [{'content': {'parts': [{'text': text}]}}]}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(gemini_vlm, 'API_BASE_URL', f"http://127.0.0.1:{server.server_port}/v1beta")
+    monkeypatch.setattr(gemini_vlm, 'VLM_BATCH_WINDOW_MS', 300.0)
+    monkeypatch.setattr(gemini_vlm, '_dispatcher', gemini_vlm.VLMBatchDispatcher(window_ms=300))
+    yield gemini
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def gray_images(tmp_path):
+    levels = {'a': 25, 'b': 127, 'c': 230}
+    paths = {}
+    for name, level in levels.items():
+        path = tmp_path / f"{name}.png"
+        Image.new('RGB', (64, 64), (level, level, level)).save(path)
+        paths[name] = str(path)
+    return paths
+
+
+def score_concurrently(paths: dict) -> dict:
+    results = {}
+    threads = [
+        threading.Thread(target=lambda n=name, p=path: results.__setitem__(n, gemini_vlm.get_batched_vlm_reasoning_score(p)))
+        for name, path in paths.items()
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_calls_share_one_request(stub, gray_images):
+    results = score_concurrently(gray_images)
+
+    assert stub.requests == [3]
+    assert results == {'a': 0.1, 'b': 0.5, 'c': 0.9}
+
+
+@pytest.mark.parametrize('batch_reply', ['[0.1, 0.5]', 'Image 1 looks real, image 2 looks fake'])
+def test_malformed_batch_reply_falls_back_per_image(stub, gray_images, batch_reply):
+    stub.batch_reply = batch_reply
+
+    results = score_concurrently(gray_images)
+
+    assert sorted(stub.requests) == [1, 1, 1, 3]
+    assert results == {'a': 0.1, 'b': 0.5, 'c': 0.9}
+
+
+def test_oversized_batch_rejection_falls_back_per_image(stub, gray_images):
+    stub.batch_status = 413
+
+    results = score_concurrently(gray_images)
+
+    assert sorted(stub.requests) == [1, 1, 1, 3]
+    assert results == {'a': 0.1, 'b': 0.5, 'c': 0.9}
+
+
+def test_batches_are_capped_by_encoded_bytes(stub, gray_images, monkeypatch):
+    image_bytes = len(gemini_vlm.encode_vlm_image(gray_images['a']))
+    dispatcher = gemini_vlm.VLMBatchDispatcher(window_ms=300, max_batch_bytes=2 * image_bytes + 100)
+    monkeypatch.setattr(gemini_vlm, '_dispatcher', dispatcher)
+
+    results = score_concurrently(gray_images)
+
+    assert sorted(stub.requests) == [1, 2]
+    assert results == {'a': 0.1, 'b': 0.5, 'c': 0.9}
+
+
+def test_cancelled_entries_are_not_scored():
+    dispatcher = gemini_vlm.VLMBatchDispatcher(window_ms=0)
+    abandoned, waiting = gemini_vlm.Future(), gemini_vlm.Future()
+    abandoned.cancel()
+    dispatcher._queue.put(('abandoned', abandoned))
+    dispatcher._queue.put(('waiting', waiting))
+
+    assert dispatcher._take() == ('waiting', waiting)
+
+
+def test_transport_failure_does_not_retry_per_image(monkeypatch):
+    calls = []
+
+    def failing_generate_content(parts, timeout=20):
+        calls.append(parts)
+        raise gemini_vlm.requests.exceptions.ConnectionError("down")
+
+    monkeypatch.setattr(gemini_vlm, '_generate_content', failing_generate_content)
+
+    assert gemini_vlm._score_encoded_batch(['x', 'y']) == [gemini_vlm.SAFER_FALLBACK] * 2
+    assert len(calls) == 1
+
+
+def test_dispatch_resolves_every_future_on_short_scores(monkeypatch):
+    monkeypatch.setattr(gemini_vlm, '_score_encoded_batch', lambda images: [0.9])
+    dispatcher = gemini_vlm.VLMBatchDispatcher(window_ms=0)
+    batch = [('x', gemini_vlm.Future()), ('y', gemini_vlm.Future())]
+
+    dispatcher._inflight.acquire()
+    dispatcher._dispatch(batch)
+
+    assert [f.result(timeout=0) for _, f in batch] == [0.9, gemini_vlm.SAFER_FALLBACK]
+
+
+def test_chunk_encoded_images_caps_count_and_bytes():
+    assert gemini_vlm._chunk_encoded_images(['aa', 'bb', 'cc'], 2, 100) == [['aa', 'bb'], ['cc']]
+    assert gemini_vlm._chunk_encoded_images(['aaaa', 'bb', 'cc', 'dddddd'], 8, 5) == [['aaaa'], ['bb', 'cc'], ['dddddd']]
+    assert gemini_vlm._chunk_encoded_images([], 8, 5) == []
+
+
+def test_get_vlm_reasoning_scores_splits_into_chunks(monkeypatch):
+    batches = []
+
+    def fake_batch(encoded_images):
+        batches.append(list(encoded_images))
+        return [float(data) / 10 for data in encoded_images]
+
+    monkeypatch.setattr(gemini_vlm, '_score_encoded_batch', fake_batch)
+    monkeypatch.setattr(gemini_vlm, 'VLM_BATCH_MAX_SIZE', 3)
+
+    scores = gemini_vlm.get_vlm_reasoning_scores(['1', '2', None, '3', '4', '5'])
+
+    assert sorted(batches) == [['1', '2', '3'], ['4', '5']]
+    assert scores == [0.1, 0.2, gemini_vlm.SAFER_FALLBACK, 0.3, 0.4, 0.5]
+
+
+def test_encode_vlm_image_downscales(tmp_path):
+    path = tmp_path / "large.png"
+    Image.new('RGB', (400, 200), (90, 90, 90)).save(path)
+
+    encoded = gemini_vlm.encode_vlm_image(str(path), max_side=100)
+
+    assert Image.open(BytesIO(base64.b64decode(encoded))).size == (100, 50)
+
+
+@pytest.mark.parametrize('raw, count, expected', [
+    ("```json\n[0.2, 0.8]\n```", 2, [0.2, 0.8]),
+    ("Scores: [0, 1.5]", 2, [0.0, 1.0]),
+    ("[0.2, 0.8]", 3, None),
+    ("[true, 0.8]", 2, None),
+    ("[0.2, \"high\"]", 2, None),
+    ("0.7", 1, None),
+    ("[NaN, 0.5]", 2, None),
+    ("[0.5, Infinity]", 2, None),
+])
+def test_parse_batch_scores(raw, count, expected):
+    assert gemini_vlm._parse_batch_scores(raw, count) == expected